@@ -1,4 +1,4 @@
 from .__version__ import __version__
 from .file import File
 
-__all__ = ["__version__", "File"]
+__all__ = ["File", "__version__"]
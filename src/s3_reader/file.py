@@ -1,12 +1,273 @@
 from __future__ import annotations
 
 import logging
+import mmap
+import os
+import random
+import re
+import shutil
+import sys
 import tempfile
-from dataclasses import dataclass
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, suppress
+from dataclasses import MISSING, dataclass, field, fields
+from functools import cache, partial
 from pathlib import Path
+from time import sleep
+from typing import IO, TYPE_CHECKING, Any, Callable, NamedTuple, TypeVar
 
+if TYPE_CHECKING:
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError, CredentialRetrievalError
 
-@dataclass
+_LOG = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+_MULTI_SLASH = re.compile(r"/{2,}")
+
+# Backoff in seconds between trials after credential errors.
+_RETRY_BASE = 0.05
+_RETRY_CAP = 2.0
+
+# Error codes of ClientError which are retried with a new session.
+_EXPIRED_TOKEN_CODES = frozenset(
+    ("ExpiredToken", "ExpiredTokenException", "RequestExpired")
+)
+
+# Error codes retried once with a new session. HEAD responses have no body,
+# so expired credentials of a cached session are reported as a bare 400 or
+# 403 by head_object.
+_STALE_SESSION_CODES = frozenset(("400", "403"))
+
+# Fields of File passed to the session, followed by the pool size.
+_S3_SESSION_FIELDS = (
+    "profile_name",
+    "aws_access_key_id",
+    "aws_secret_access_key",
+    "aws_session_token",
+    "region_name",
+    "role_arn",
+    "session_name",
+    "retry_mode",
+    "max_attempts",
+)
+
+# slots for dataclass is available from Python 3.10, and weakref_slot, which is
+# needed for weakref.finalize, from Python 3.11.
+_DATACLASS_OPTIONS = (
+    {"slots": True, "weakref_slot": True} if sys.version_info >= (3, 11) else {}
+)
+
+# Private generator for botocore and s3transfer, which otherwise draw retry
+# jitter and temporary file names from the global random state.
+_RANDOM = random.Random()
+
+
+@cache
+def _isolate_random() -> None:
+    import s3transfer
+    import s3transfer.utils
+    from botocore import retryhandler
+    from botocore.retries import standard
+
+    # The ignores are unused without botocore-stubs, where the modules are Any.
+    retryhandler.random = _RANDOM  # type: ignore[attr-defined, unused-ignore]
+    s3transfer.random = _RANDOM  # type: ignore[attr-defined, unused-ignore]
+    s3transfer.utils.random = _RANDOM  # type: ignore[attr-defined, unused-ignore]
+
+    class ExponentialBackoff(standard.ExponentialBackoff):  # type: ignore[misc, unused-ignore]
+        def __init__(self, **kwargs: Any) -> None:
+            kwargs.setdefault("random", _RANDOM.random)
+            super().__init__(**kwargs)
+
+    # The default random argument is bound to the global random.random.
+    standard.ExponentialBackoff = ExponentialBackoff  # type: ignore[misc, assignment, unused-ignore]
+
+
+class _RangeNotAccepted(Exception):
+    # The server advertised ranges on HEAD but answered a ranged GET with 200.
+    pass
+
+
+class _S3ObjectPath(str):
+    # Path of a key listed by File.from_prefix, which is not normalized.
+    pass
+
+
+def _allocate(fd: int, size: int) -> None:
+    # Reserve the blocks in advance to avoid extending the file at each write.
+    # Some platforms or file systems do not support fallocate.
+    if size > 0 and hasattr(os, "posix_fallocate"):
+        with suppress(OSError):
+            os.posix_fallocate(fd, 0, size)
+
+
+@cache
+def _env_int(name: str, default: int) -> int:
+    # Read once at the first use, not at each construction of File.
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    # Sizes and counts of 0 or less fail later with unrelated errors.
+    if number < 1:
+        raise ValueError(
+            f"Environment variable {name} should be a positive integer. "
+            f"({name}={value!r})"
+        )
+    return number
+
+
+class _Boto(NamedTuple):
+    TransferConfig: type[TransferConfig]
+    ClientError: type[ClientError]
+    CredentialRetrievalError: type[CredentialRetrievalError]
+
+
+@cache
+def _boto() -> _Boto:
+    # boto3 is imported at the first S3 download, not at the import of this
+    # module, as it takes time and is not needed for local files.
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError, CredentialRetrievalError
+
+    _isolate_random()
+    return _Boto(TransferConfig, ClientError, CredentialRetrievalError)
+
+
+def _new_s3_resource(
+    profile_name: str | None,
+    aws_access_key_id: str | None,
+    aws_secret_access_key: str | None,
+    aws_session_token: str | None,
+    region_name: str | None,
+    role_arn: str | None,
+    session_name: str,
+    retry_mode: str,
+    max_attempts: int,
+    max_pool_connections: int,
+) -> Any:
+    from boto3_session import Session
+    from botocore.config import Config
+
+    return Session(
+        profile_name=profile_name,
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        aws_session_token=aws_session_token,
+        region_name=region_name,
+        role_arn=role_arn,
+        session_name=session_name,
+        retry_mode=retry_mode,
+        max_attempts=max_attempts,
+    ).resource("s3", config=Config(max_pool_connections=max_pool_connections))
+
+
+# Sessions and buckets shared between File instances with the same settings.
+# functools.lru_cache does not lock while building a value, so concurrent
+# downloads would create a session (and call AssumeRole) per thread.
+_S3_CACHE_SIZE = 32
+_s3_lock = threading.Lock()
+_s3_resources: OrderedDict[tuple[Any, ...], Any] = OrderedDict()
+_s3_buckets: OrderedDict[tuple[Any, ...], Any] = OrderedDict()
+
+
+def _cached(
+    cache: OrderedDict[tuple[Any, ...], Any],
+    key: tuple[Any, ...],
+    build: Callable[[], Any],
+) -> Any:
+    # Must be called with _s3_lock held.
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = cache[key] = build()
+    if len(cache) > _S3_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def _s3_resource(*resource_args: Any) -> Any:
+    with _s3_lock:
+        return _cached(
+            _s3_resources, resource_args, lambda: _new_s3_resource(*resource_args)
+        )
+
+
+def _s3_bucket(bucket_name: str, *resource_args: Any) -> Any:
+    # Resources of the same service compare equal, so the cache is keyed by
+    # the arguments of _s3_resource rather than by the resource itself.
+    with _s3_lock:
+        resource = _cached(
+            _s3_resources, resource_args, lambda: _new_s3_resource(*resource_args)
+        )
+        return _cached(
+            _s3_buckets,
+            (bucket_name, *resource_args),
+            lambda: resource.Bucket(bucket_name),
+        )
+
+
+def _forget_s3_resource(*resource_args: Any) -> None:
+    # Drop only the entries of these settings, e.g. for expired credentials.
+    with _s3_lock:
+        _s3_resources.pop(resource_args, None)
+        for key in [key for key in _s3_buckets if key[1:] == resource_args]:
+            del _s3_buckets[key]
+
+
+def _retry_s3(
+    action: Callable[[], _T],
+    resource_args: tuple[Any, ...],
+    max_trials: int,
+    what: str,
+    path: str,
+) -> _T:
+    # Run action, retrying credential errors and expired tokens with a new
+    # session.
+    boto = _boto()
+    err = None
+    trials = 0
+    rebuilt = False
+    while trials < max_trials:
+        try:
+            return action()
+        except (boto.CredentialRetrievalError, boto.ClientError) as e:
+            # Do not keep a session which may hold expired credentials, even
+            # if the error is not retried.
+            _forget_s3_resource(*resource_args)
+            if isinstance(e, boto.ClientError):
+                code = e.response.get("Error", {}).get("Code")
+                stale = code in _STALE_SESSION_CODES and not rebuilt
+                # Other client errors such as 404 are not retried.
+                if code not in _EXPIRED_TOKEN_CODES and not stale:
+                    _LOG.error(f"Failed to {what}: {path}.")
+                    raise
+                rebuilt = rebuilt or stale
+            err = e
+            _LOG.warning(f"Failed to retrieve credentials. Retrying to {what}.")
+            trials += 1
+            # Capped exponential backoff with jitter, not after the last one.
+            if trials < max_trials:
+                sleep(
+                    min(_RETRY_CAP, _RETRY_BASE * 2 ** (trials - 1))
+                    * (0.5 + _RANDOM.random())
+                )
+    _LOG.error(f"Failed to {what}: {path}.")
+    if err is not None:
+        raise RuntimeError(f"Failed to {what} after {max_trials} trials.") from err
+    raise ValueError(f"Unknown error occurred. Failed to {what}.")
+
+
+@dataclass(eq=False, repr=False, **_DATACLASS_OPTIONS)
 class File:
     """A class to manage S3 file as a local file.
 
@@ -38,8 +299,30 @@ class File:
     max_attempts : int
         Maximum number of retry attempts for failed requests. Default is 10.
     max_trials : int
-        Maximum number of trials to retry after retrieving credential error.
-        Default is 10.
+        Maximum number of trials to retry after retrieving credential error
+        or expired token error. Default is 10.
+    multipart_threshold : int
+        File size threshold to use multipart download. Default is 8 MiB.
+    multipart_chunksize : int
+        Size of each part in multipart download. Default is the value of
+        S3_READER_PART environment variable or 16 MiB.
+    max_concurrency : int
+        Maximum number of threads for multipart download. Default is the value
+        of S3_READER_CONCURRENCY environment variable or 10.
+    io_chunksize : int
+        Size of each chunk to read from the response and write to the local
+        file. Default is the value of S3_READER_IO_CHUNKSIZE environment
+        variable or 256 KiB.
+    max_io_queue : int
+        Maximum number of chunks queued for writing when boto3's download_file
+        is used (platforms without os.pwrite). Default is the value of
+        S3_READER_IO_QUEUE environment variable or 1000.
+    mmap_max_size : int
+        Maximum file size to be mapped by the mmap property. Larger files are
+        opened as a normal file object instead. Default is 1 GiB.
+    max_pool_connections : int | None
+        Maximum number of connections kept in the connection pool of the S3
+        client. If None, max_concurrency is used. Default is None.
     """
 
     path: str | Path
@@ -54,111 +337,417 @@ class File:
     retry_mode: str = "standard"
     max_attempts: int = 10
     max_trials: int = 10
+    multipart_threshold: int = 8 * 1024 * 1024
+    multipart_chunksize: int = field(
+        default_factory=partial(_env_int, "S3_READER_PART", 16 * 1024 * 1024)
+    )
+    max_concurrency: int = field(
+        default_factory=partial(_env_int, "S3_READER_CONCURRENCY", 10)
+    )
+    io_chunksize: int = field(
+        default_factory=partial(_env_int, "S3_READER_IO_CHUNKSIZE", 256 * 1024)
+    )
+    max_io_queue: int = field(
+        default_factory=partial(_env_int, "S3_READER_IO_QUEUE", 1000)
+    )
+    mmap_max_size: int = 1024 * 1024 * 1024
+    max_pool_connections: int | None = None
+    log: logging.Logger = field(init=False, default=_LOG)
+    orig_path: str = field(init=False)
+    temp_dir_path: str | None = field(init=False, default=None)
+    _mmap: mmap.mmap | IO[bytes] | None = field(init=False, default=None)
+    _scheme: str = field(init=False, default="")
+    # weakref.finalize is not subscriptable at runtime (typing.get_type_hints).
+    _finalizer: weakref.finalize | None = field(init=False, default=None)  # type: ignore[type-arg]
 
     def __post_init__(self) -> None:
-        self.log = logging.getLogger(__name__)
-        self.path = self.fix_path(self.path)
+        if isinstance(self.path, _S3ObjectPath):
+            # Listed keys are used as they are, as "//" is valid in a key.
+            self.path, self._scheme = str(self.path), "s3"
+        else:
+            self.path, self._scheme = self.split_scheme(self.path)
         self.orig_path = self.path
         self.load()
 
-    def __del__(self) -> None:
-        self.cleanup()
+    @classmethod
+    def download_many(
+        cls, paths: Iterable[str | Path], max_workers: int = 16, **kwargs: Any
+    ) -> list[File]:
+        """Create File objects for multiple paths in parallel.
+
+        Parameters
+        ----------
+        paths : Iterable[str | Path]
+            The paths of the files.
+        max_workers : int
+            Maximum number of files downloaded at the same time. For a short
+            burst, it can be as large as the number of paths. For a long run,
+            keep it at most around max_concurrency * 2 to avoid throttling.
+            Default is 16.
+        **kwargs : Any
+            Other arguments passed to File. Unless max_pool_connections is
+            given, it is set to max_workers * max_concurrency, as each file
+            downloads up to max_concurrency ranges through the shared session.
+
+        Returns
+        -------
+        list[File]
+            File objects in the same order as paths.
+        """
+        kwargs = cls._with_pool_size(max_workers, kwargs)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda path: cls(path, **kwargs), paths))
+
+    @classmethod
+    def _with_pool_size(
+        cls, max_workers: int, kwargs: dict[str, Any]
+    ) -> dict[str, Any]:
+        if "max_pool_connections" in kwargs:
+            return kwargs
+        pool = max_workers * cls._option("max_concurrency", kwargs)
+        return {**kwargs, "max_pool_connections": pool}
+
+    @classmethod
+    def _option(cls, name: str, kwargs: dict[str, Any]) -> Any:
+        # The value of the field which File(**kwargs) would have.
+        if name in kwargs:
+            return kwargs[name]
+        option = next(f for f in fields(cls) if f.name == name)
+        if option.default_factory is not MISSING:
+            return option.default_factory()
+        return option.default
+
+    @classmethod
+    def from_prefix(
+        cls, s3_prefix: str, max_workers: int = 16, **kwargs: Any
+    ) -> list[File]:
+        """Download all S3 objects under the prefix in parallel.
+
+        All objects are listed by one paginated request and downloaded through
+        one shared session. Listed keys are used as they are, without the
+        normalization of slashes applied to other paths. Credential errors and
+        expired tokens during the listing are retried in the same way as the
+        download.
+
+        Parameters
+        ----------
+        s3_prefix : str
+            The S3 prefix (s3://<bucket>/<prefix>).
+        max_workers : int
+            Maximum number of files downloaded at the same time. Default is 16.
+        **kwargs : Any
+            Other arguments passed to File. Unless max_pool_connections is
+            given, it is set to max_workers * max_concurrency.
+
+        Returns
+        -------
+        list[File]
+            File objects in the order of the listed keys.
+        """
+        path, scheme = cls.split_scheme(s3_prefix)
+        if scheme != "s3":
+            raise ValueError(f"The path should start with s3:. (path={s3_prefix})")
+        bucket_name, prefix = cls.extract_s3_info(path)
+        # Keep the trailing slash, which fix_path removes, so that
+        # s3://bucket/dir/ does not match s3://bucket/dir2/.
+        if prefix and s3_prefix.endswith("/"):
+            prefix += "/"
+        kwargs = cls._with_pool_size(max_workers, kwargs)
+        resource_args = cls._s3_resource_args(partial(cls._option, kwargs=kwargs))
+
+        def list_paths() -> list[str]:
+            client = _s3_resource(*resource_args).meta.client
+            return [
+                _S3ObjectPath(f"s3://{bucket_name}/{content['Key']}")
+                for page in client.get_paginator("list_objects_v2").paginate(
+                    Bucket=bucket_name, Prefix=prefix
+                )
+                for content in page.get("Contents", [])
+                # Skip "directory" placeholders.
+                if not content["Key"].endswith("/")
+            ]
+
+        paths = _retry_s3(
+            list_paths,
+            resource_args,
+            cls._option("max_trials", kwargs),
+            "list the objects",
+            s3_prefix,
+        )
+        return cls.download_many(paths, max_workers=max_workers, **kwargs)
 
     def load(self) -> None:
         if self.file_name is None:
             self.file_name = Path(self.path).name
-        self.temp_dir: tempfile.TemporaryDirectory | None = None  # type: ignore
-        self.path = str(self.path)
-        if self.path.startswith("s3:"):
+        self.temp_dir_path = None
+        if self._scheme == "s3":
             self.download_s3_file()
-        elif self.path.startswith("http:") or self.path.startswith("https:"):
+        elif self._scheme in ("http", "https"):
             self.download_http_file()
 
+    @property
+    def mmap(self) -> mmap.mmap | IO[bytes]:
+        """Read-only memory map of the local file.
+
+        The map is created at the first access and closed by cleanup(). If
+        the file is empty or larger than mmap_max_size, the file opened in
+        binary mode is returned instead.
+        """
+        if self._mmap is not None:
+            return self._mmap
+        size = os.path.getsize(self.path)
+        if size == 0 or size > self.mmap_max_size:
+            self._mmap = open(self.path, "rb")  # noqa: SIM115
+            return self._mmap
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        for advice in ("MADV_SEQUENTIAL", "MADV_WILLNEED"):
+            if hasattr(mmap, advice):
+                mm.madvise(getattr(mmap, advice))
+        self._mmap = mm
+        return mm
+
     def cleanup(self) -> None:
-        if self.temp_dir is not None:
-            self.temp_dir.cleanup()
-            self.temp_dir = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+            self.temp_dir_path = None
+
+    def make_temp_dir(self) -> None:
+        self.temp_dir_path = tempfile.mkdtemp(prefix="s3reader-")
+        self.path = f"{self.temp_dir_path}/{self.file_name}"
+        # The directory is removed when the object is garbage collected or at
+        # the interpreter exit, even if the download fails.
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, self.temp_dir_path, ignore_errors=True
+        )
 
     @staticmethod
     def fix_path(path: str | Path) -> str:
+        return File.split_scheme(path)[0]
+
+    @staticmethod
+    def split_scheme(path: str | Path) -> tuple[str, str]:
+        """Fix the path and extract its scheme.
+
+        Parameters
+        ----------
+        path : str | Path
+            The path of the file.
+
+        Returns
+        -------
+        tuple[str, str]
+            The fixed path and the scheme (e.g. "s3"). The scheme is an empty
+            string for a local path.
+        """
         if not path:
-            return ""
+            return "", ""
+        path = str(path)
         # remove double slash during the path (other than starting of s3://)
-        if ":/" in str(path):
-            pathes = str(path).split(":/")
-            return f"{pathes[0]}:/{Path(pathes[1])}"
-        return str(Path(path))
+        sep = path.find(":/")
+        fixed = _MULTI_SLASH.sub("/", path if sep < 0 else path[sep + 2 :])
+        if len(fixed) > 1:
+            fixed = fixed.rstrip("/")
+        if sep < 0:
+            return fixed, ""
+        return f"{path[:sep]}:/{fixed}", path[:sep]
 
     @staticmethod
     def extract_s3_info(path: str | Path) -> tuple[str, str]:
-        path = str(path)
-        split_path = path.split("/")
-        bucket_name = split_path[2]
-        key = "/".join(split_path[3:])
+        bucket_name, _, key = str(path).partition("://")[2].partition("/")
         return bucket_name, key
 
     def download_s3_file(self) -> None:
-        # boto3.session.Session(profile_name=self.s3_profile).resource("s3") uses random.
-        # To avoid unnoticed change of random state, restore random state after the process.
-        import random
-        from time import sleep
+        boto = _boto()
 
-        from boto3_session import Session
-        from botocore.exceptions import ClientError, CredentialRetrievalError
+        bucket_name, key = self.extract_s3_info(self.orig_path)
+        self.make_temp_dir()
 
-        state = random.getstate()
+        resource_args = self.s3_resource_args()
 
-        bucket_name, key = self.extract_s3_info(self.orig_path)
-        self.temp_dir = tempfile.TemporaryDirectory()
-        self.path = f"{self.temp_dir.name}/{self.file_name}"
-
-        err = None
-        trials = 0
-        while trials < self.max_trials:
-            try:
-                s3 = Session(
-                    profile_name=self.profile_name,
-                    aws_access_key_id=self.aws_access_key_id,
-                    aws_secret_access_key=self.aws_secret_access_key,
-                    aws_session_token=self.aws_session_token,
-                    region_name=self.region_name,
-                    role_arn=self.role_arn,
-                    session_name=self.session_name,
-                    retry_mode=self.retry_mode,
-                    max_attempts=self.max_attempts,
-                ).resource("s3")
-                bucket = s3.Bucket(bucket_name)
-                bucket.download_file(key, self.path)
-                break
-            except (CredentialRetrievalError, ClientError) as e:
-                err = e
-                self.log.warning(
-                    "Failed to retrieve credentials. Retrying to download the file."
+        def download() -> None:
+            if hasattr(os, "pwrite"):
+                s3 = _s3_resource(*resource_args)
+                self.download_s3_ranges(s3.meta.client, bucket_name, key)
+            else:
+                # os.pwrite is not available (e.g. Windows).
+                # download_file issues head_object by itself and uses a single
+                # GET for objects under multipart_threshold.
+                config = boto.TransferConfig(
+                    multipart_threshold=self.multipart_threshold,
+                    multipart_chunksize=self.multipart_chunksize,
+                    max_concurrency=self.max_concurrency,
+                    io_chunksize=self.io_chunksize,
+                    max_io_queue=self.max_io_queue,
+                    use_threads=True,
                 )
-                trials += 1
-                sleep(1)
-                continue
+                bucket = _s3_bucket(bucket_name, *resource_args)
+                bucket.download_file(key, self.path, Config=config)
+
+        _retry_s3(
+            download,
+            resource_args,
+            self.max_trials,
+            "download the file",
+            self.orig_path,
+        )
+
+    def s3_resource_args(self) -> tuple[Any, ...]:
+        return self._s3_resource_args(partial(getattr, self))
+
+    @classmethod
+    def _s3_resource_args(cls, get: Callable[[str], Any]) -> tuple[Any, ...]:
+        # Sessions are shared between File instances with the same settings.
+        pool = get("max_pool_connections")
+        return (
+            *(get(name) for name in _S3_SESSION_FIELDS),
+            get("max_concurrency") if pool is None else pool,
+        )
+
+    def download_s3_ranges(self, client: Any, bucket_name: str, key: str) -> None:
+        head = client.head_object(Bucket=bucket_name, Key=key)
+
+        def open_range(start: int, end: int) -> IO[bytes]:
+            # IfMatch makes sure all parts come from the same object version.
+            return client.get_object(
+                Bucket=bucket_name,
+                Key=key,
+                Range=f"bytes={start}-{end}",
+                IfMatch=head["ETag"],
+            )["Body"]
+
+        self.write_ranges(head["ContentLength"], open_range)
+
+    def write_ranges(
+        self, size: int, open_range: Callable[[int, int], IO[bytes]]
+    ) -> None:
+        """Download ranges in parallel and write them to self.path.
+
+        Parameters
+        ----------
+        size : int
+            The size of the whole file.
+        open_range : Callable[[int, int], IO[bytes]]
+            A function which takes the first and the last byte positions
+            (inclusive) and returns a stream of the range.
+        """
+        if size < self.multipart_threshold:
+            chunksize = max(size, 1)
         else:
-            self.log.error(f"Failed to download the file: {self.orig_path}.")
-            if err is not None:
-                raise err
-            else:
-                raise ValueError("Unknown error occurred. Failed to download the file.")
+            chunksize = self.multipart_chunksize
+        ranges = [
+            (start, min(start + chunksize, size) - 1)
+            for start in range(0, size, chunksize)
+        ]
+
+        # 0o666 as open() uses, so that the umask gives the usual permissions.
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            _allocate(fd, size)
+
+            def write_range(start: int, end: int) -> None:
+                with closing(open_range(start, end)) as body:
+                    offset = start
+                    while chunk := body.read(self.io_chunksize):
+                        # pwrite may write only a part of the chunk.
+                        view = memoryview(chunk)
+                        while view:
+                            written = os.pwrite(fd, view, offset)
+                            view = view[written:]
+                            offset += written
+                # A short range would leave allocated zeros in the file.
+                if offset != end + 1:
+                    raise ValueError(
+                        f"Incomplete range bytes={start}-{end}. (path={self.orig_path})"
+                    )
 
-        random.setstate(state)
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                list(executor.map(lambda r: write_range(*r), ranges))
+        finally:
+            os.close(fd)
 
     def download_http_file(self) -> None:
         import urllib.request
 
-        self.temp_dir = tempfile.TemporaryDirectory()
-        self.path = f"{self.temp_dir.name}/{self.file_name}"
+        self.make_temp_dir()
 
-        if not self.orig_path.startswith("http:") and not (
-            self.orig_path.startswith("http:") or self.orig_path.startswith("https:")
-        ):
+        if not self.orig_path.startswith(("http:", "https:")):
             raise ValueError(
                 f"The path should start with http: or https:. (path={self.orig_path})"
             )
+
+        if hasattr(os, "pwrite") and self.download_http_ranges():
+            return
+
         with urllib.request.urlopen(self.orig_path) as orig_file:  # nosec
-            with open(self.path, "wb") as dest_file:
-                dest_file.write(orig_file.read())
+            length = orig_file.headers.get("Content-Length")
+            written = 0
+            with open(self.path, "wb", buffering=0) as dest_file:
+                if length is not None:
+                    _allocate(dest_file.fileno(), int(length))
+                # Read into one reusable buffer instead of allocating new
+                # bytes for each chunk.
+                buffer = memoryview(bytearray(1024 * 1024))
+                while size := orig_file.readinto(buffer):
+                    # The unbuffered file may write only a part of the slice.
+                    view = buffer[:size]
+                    while view:
+                        view = view[dest_file.write(view) :]
+                    written += size
+        # readinto does not raise IncompleteRead for a truncated body.
+        if length is not None and written != int(length):
+            raise ValueError(
+                f"Incomplete download: {written} of {length} bytes. (path={self.orig_path})"
+            )
+
+    def download_http_ranges(self) -> bool:
+        """Download the file by parallel ranged GETs if the server allows.
+
+        Returns
+        -------
+        bool
+            True if the file was downloaded, False if the server does not
+            support ranged requests (including a ranged GET answered with
+            200) or the file is smaller than multipart_threshold.
+        """
+        import urllib.error
+        import urllib.request
+
+        request = urllib.request.Request(self.orig_path, method="HEAD")
+        try:
+            with urllib.request.urlopen(request) as head:  # nosec
+                url = head.url
+                accept_ranges = head.headers.get("Accept-Ranges", "")
+                length = head.headers.get("Content-Length")
+        except urllib.error.HTTPError:
+            # Some servers do not allow HEAD.
+            return False
+        if accept_ranges != "bytes" or length is None:
+            return False
+        size = int(length)
+        if size < self.multipart_threshold:
+            return False
+
+        def open_range(start: int, end: int) -> IO[bytes]:
+            request = urllib.request.Request(
+                url, headers={"Range": f"bytes={start}-{end}"}
+            )
+            response = urllib.request.urlopen(request)  # nosec
+            if response.status != 206:
+                response.close()
+                raise _RangeNotAccepted
+            return response
+
+        try:
+            self.write_ranges(size, open_range)
+        except _RangeNotAccepted:
+            _LOG.info(f"Ranged request was not accepted: {self.orig_path}.")
+            return False
+        return True
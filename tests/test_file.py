@@ -0,0 +1,555 @@
+import gc
+import io
+import mmap
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from botocore.exceptions import ClientError, CredentialRetrievalError
+
+from s3_reader import File
+from s3_reader import file as file_module
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("", ""),
+        ("s3://bucket/a//b///c", "s3://bucket/a/b/c"),
+        ("s3://bucket/dir/", "s3://bucket/dir"),
+        ("https://example.com//a/b.txt", "https://example.com/a/b.txt"),
+        ("/tmp//a/b/", "/tmp/a/b"),
+        ("a//b", "a/b"),
+        ("/", "/"),
+    ],
+)
+def test_fix_path(path, expected):
+    assert File.fix_path(path) == expected
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("", ("", "")),
+        ("s3://bucket//a.txt", ("s3://bucket/a.txt", "s3")),
+        ("https://example.com/a.txt", ("https://example.com/a.txt", "https")),
+        ("/tmp//a.txt", ("/tmp/a.txt", "")),
+    ],
+)
+def test_split_scheme(path, expected):
+    assert File.split_scheme(path) == expected
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("s3://bucket/a/b/c.txt", ("bucket", "a/b/c.txt")),
+        ("s3://bucket/c.txt", ("bucket", "c.txt")),
+        ("s3://bucket", ("bucket", "")),
+    ],
+)
+def test_extract_s3_info(path, expected):
+    assert File.extract_s3_info(path) == expected
+
+
+@pytest.mark.parametrize("value", ["16M", "0", "-1"])
+def test_env_int_error(monkeypatch, tmp_path, value):
+    monkeypatch.setenv("S3_READER_PART", value)
+    file_module._env_int.cache_clear()
+    with pytest.raises(ValueError, match="S3_READER_PART"):
+        File(tmp_path / "data.txt")
+    file_module._env_int.cache_clear()
+
+
+def test_mmap(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"abc\ndef\n")
+    file = File(path)
+    mm = file.mmap
+    assert isinstance(mm, mmap.mmap)
+    assert mm[:] == b"abc\ndef\n"
+    assert file.mmap is mm
+    file.cleanup()
+    assert mm.closed
+
+
+def test_mmap_fallback(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"abc\ndef\n")
+    file = File(path, mmap_max_size=4)
+    f = file.mmap
+    assert not isinstance(f, mmap.mmap)
+    assert f.read() == b"abc\ndef\n"
+    file.cleanup()
+    assert f.closed
+
+
+def test_download_many(tmp_path):
+    paths = [tmp_path / f"data{i}.txt" for i in range(3)]
+    files = File.download_many(paths, max_workers=2)
+    assert [file.path for file in files] == [str(path) for path in paths]
+    assert files[0].max_pool_connections == 2 * files[0].max_concurrency
+
+    files = File.download_many(paths, max_workers=2, max_concurrency=3)
+    assert files[0].max_pool_connections == 6
+    files = File.download_many(paths, max_workers=2, max_pool_connections=5)
+    assert files[0].max_pool_connections == 5
+
+
+class StubS3Client:
+    def __init__(self, data=b"", short=0, pages=(), errors=None):
+        self.data = data
+        self.short = short
+        self.pages = list(pages)
+        # Errors raised, in order, by the next calls of each method.
+        self.errors = {name: list(e) for name, e in (errors or {}).items()}
+        self.calls = []
+        self.ranges = []
+
+    def call(self, name, arg):
+        self.calls.append((name, arg))
+        if self.errors.get(name):
+            raise self.errors[name].pop(0)
+
+    def head_object(self, Bucket, Key):
+        self.call("head_object", Key)
+        return {"ContentLength": len(self.data), "ETag": '"etag"'}
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        self.call("get_object", Key)
+        assert IfMatch == '"etag"'
+        start, end = map(int, Range.removeprefix("bytes=").split("-"))
+        self.ranges.append((start, end))
+        return {"Body": io.BytesIO(self.data[start : end + 1 - self.short])}
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        self.call("paginate", Prefix)
+        return iter(self.pages)
+
+    def count(self, name):
+        return sum(call[0] == name for call in self.calls)
+
+
+def use_s3_client(monkeypatch, client):
+    """Build every S3 session around client with empty caches.
+
+    Returns the list of the settings of the built sessions.
+    """
+    monkeypatch.setattr(file_module, "_s3_resources", OrderedDict())
+    monkeypatch.setattr(file_module, "_s3_buckets", OrderedDict())
+    built = []
+
+    def new_s3_resource(*args):
+        built.append(args)
+        return SimpleNamespace(meta=SimpleNamespace(client=client))
+
+    monkeypatch.setattr(file_module, "_new_s3_resource", new_s3_resource)
+    return built
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(file_module, "sleep", sleeps.append)
+    return sleeps
+
+
+def client_error(code, operation="HeadObject"):
+    # HeadObject errors have no body, so the code is the HTTP status.
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+def credential_error():
+    return CredentialRetrievalError(provider="test", error_msg="test")
+
+
+def test_download_s3_file_not_retried(monkeypatch, sleeps):
+    client = StubS3Client(b"data", errors={"head_object": [client_error("404")]})
+    use_s3_client(monkeypatch, client)
+    with pytest.raises(ClientError):
+        File("s3://bucket/key.bin", max_trials=3)
+    assert client.count("head_object") == 1
+    assert sleeps == []
+    # The session is not kept after a client error.
+    assert not file_module._s3_resources
+
+
+@pytest.mark.parametrize(
+    ("errors", "trials"),
+    [
+        (lambda: {"head_object": [credential_error(), credential_error()]}, 3),
+        (lambda: {"head_object": [client_error("400")]}, 2),
+        (lambda: {"head_object": [client_error("403")]}, 2),
+        (lambda: {"get_object": [client_error("ExpiredToken", "GetObject")]}, 2),
+    ],
+)
+def test_download_s3_file_retried(monkeypatch, sleeps, errors, trials):
+    client = StubS3Client(b"data", errors=errors())
+    built = use_s3_client(monkeypatch, client)
+    file = File("s3://bucket/key.bin", max_trials=3)
+    with open(file.path, "rb") as f:
+        assert f.read() == b"data"
+    assert client.count("head_object") == trials
+    assert len(sleeps) == trials - 1
+    assert len(built) == trials
+
+
+def test_download_s3_file_stale_session(monkeypatch, sleeps):
+    client = StubS3Client(b"data", errors={"head_object": [client_error("400")] * 2})
+    built = use_s3_client(monkeypatch, client)
+    # A bare 400 is retried only once.
+    with pytest.raises(ClientError):
+        File("s3://bucket/key.bin", max_trials=3)
+    assert client.count("head_object") == 2
+    assert not file_module._s3_resources
+    # The next File does not reuse the failed session.
+    file = File("s3://bucket/key.bin", max_trials=3)
+    with open(file.path, "rb") as f:
+        assert f.read() == b"data"
+    assert len(built) == 3
+
+
+def test_download_s3_file_no_sleep_after_last_trial(monkeypatch, sleeps):
+    client = StubS3Client(b"data", errors={"head_object": [credential_error()] * 4})
+    use_s3_client(monkeypatch, client)
+    with pytest.raises(RuntimeError):
+        File("s3://bucket/key.bin", max_trials=4)
+    assert client.count("head_object") == 4
+    assert len(sleeps) == 3
+
+
+def test_download_s3_file_error_chain(monkeypatch, sleeps):
+    errors = [credential_error() for _ in range(3)]
+    client = StubS3Client(b"data", errors={"head_object": errors})
+    use_s3_client(monkeypatch, client)
+    with pytest.raises(RuntimeError, match="after 3 trials") as exc_info:
+        File("s3://bucket/key.bin", max_trials=3)
+    assert exc_info.value.__cause__ is errors[-1]
+    assert client.count("head_object") == 3
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason="X | Y needs 3.10")
+def test_type_hints():
+    hints = typing.get_type_hints(File)
+    assert hints["path"] == typing.Union[str, Path]
+
+
+def test_temp_dir_cleanup(monkeypatch):
+    use_s3_client(monkeypatch, StubS3Client(b"data"))
+    file = File("s3://bucket/key.bin")
+    temp_dir = file.temp_dir_path
+    assert os.path.isfile(file.path)
+    file.cleanup()
+    assert not os.path.exists(temp_dir)
+    assert file.temp_dir_path is None
+
+
+def test_temp_dir_gc(monkeypatch):
+    use_s3_client(monkeypatch, StubS3Client(b"data"))
+    file = File("s3://bucket/key.bin")
+    temp_dir = file.temp_dir_path
+    del file
+    gc.collect()
+    assert not os.path.exists(temp_dir)
+
+
+def test_temp_dir_failed_download(monkeypatch):
+    temp_dirs = []
+    mkdtemp = tempfile.mkdtemp
+
+    def record_mkdtemp(**kwargs):
+        temp_dirs.append(mkdtemp(**kwargs))
+        return temp_dirs[-1]
+
+    monkeypatch.setattr(tempfile, "mkdtemp", record_mkdtemp)
+    client = StubS3Client(b"data", errors={"head_object": [client_error("404")]})
+    use_s3_client(monkeypatch, client)
+    with pytest.raises(ClientError):
+        File("s3://bucket/key.bin")
+    gc.collect()
+    assert len(temp_dirs) == 1
+    assert not os.path.exists(temp_dirs[0])
+
+
+def test_download_s3_ranges(tmp_path):
+    data = bytes(range(256)) * 4 + b"tail"
+    client = StubS3Client(data)
+    file = File(
+        tmp_path / "out.bin",
+        multipart_threshold=100,
+        multipart_chunksize=300,
+        io_chunksize=64,
+    )
+    file.download_s3_ranges(client, "bucket", "key")
+    assert (tmp_path / "out.bin").read_bytes() == data
+    assert sorted(client.ranges) == [(0, 299), (300, 599), (600, 899), (900, 1027)]
+
+
+def test_download_s3_ranges_mode(tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+    file = File(tmp_path / "out.bin")
+    file.download_s3_ranges(StubS3Client(b"data"), "bucket", "key")
+    assert os.stat(tmp_path / "out.bin").st_mode & 0o777 == 0o666 & ~umask
+
+
+def test_download_s3_ranges_short_write(monkeypatch, tmp_path):
+    pwrite = os.pwrite
+
+    def short_pwrite(fd, data, offset):
+        return pwrite(fd, bytes(data[:3]), offset)
+
+    monkeypatch.setattr(os, "pwrite", short_pwrite)
+    data = bytes(range(100))
+    file = File(tmp_path / "out.bin", io_chunksize=8)
+    file.download_s3_ranges(StubS3Client(data), "bucket", "key")
+    assert (tmp_path / "out.bin").read_bytes() == data
+
+
+def test_download_s3_ranges_empty(tmp_path):
+    client = StubS3Client(b"")
+    file = File(tmp_path / "out.bin")
+    file.download_s3_ranges(client, "bucket", "key")
+    assert (tmp_path / "out.bin").read_bytes() == b""
+    assert client.ranges == []
+
+
+def test_download_s3_ranges_single(tmp_path):
+    data = b"0123456789"
+    client = StubS3Client(data)
+    file = File(tmp_path / "out.bin", multipart_threshold=100, multipart_chunksize=3)
+    file.download_s3_ranges(client, "bucket", "key")
+    assert (tmp_path / "out.bin").read_bytes() == data
+    assert client.ranges == [(0, 9)]
+
+
+def test_download_s3_ranges_incomplete(tmp_path):
+    client = StubS3Client(b"0123456789", short=1)
+    file = File(tmp_path / "out.bin", multipart_threshold=4, multipart_chunksize=4)
+    with pytest.raises(ValueError, match="Incomplete range"):
+        file.download_s3_ranges(client, "bucket", "key")
+
+
+HTTP_DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def http_server():
+    servers = []
+
+    def start(ranges=True, head=True, ranged_get=True, errors=0, truncate=0):
+        requests = []
+        failures = [500] * errors
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_headers(self, body, status):
+                self.send_response(status)
+                if ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", '"etag"')
+                self.end_headers()
+
+            def do_HEAD(self):
+                requests.append(("HEAD", None))
+                if failures:
+                    self.send_response(failures.pop())
+                    self.end_headers()
+                    return
+                if not head:
+                    self.send_response(405)
+                    self.end_headers()
+                    return
+                self.send_headers(HTTP_DATA, 200)
+
+            def do_GET(self):
+                range_header = self.headers.get("Range")
+                requests.append(("GET", range_header))
+                if ranges and ranged_get and range_header:
+                    start, end = map(
+                        int, range_header.removeprefix("bytes=").split("-")
+                    )
+                    body = HTTP_DATA[start : end + 1]
+                    self.send_headers(body, 206)
+                else:
+                    body = HTTP_DATA
+                    self.send_headers(body, 200)
+                self.wfile.write(body[: len(body) - truncate])
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/data.bin", requests
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_download_http_file_streamed(http_server):
+    url, requests = http_server(ranges=False)
+    file = File(url)
+    with open(file.path, "rb") as f:
+        assert f.read() == HTTP_DATA
+    assert ("GET", None) in requests
+
+
+def test_download_http_file_truncated(http_server):
+    url, _ = http_server(ranges=False, truncate=100)
+    with pytest.raises(ValueError, match="Incomplete download"):
+        File(url)
+
+
+def test_download_http_file_ranges(http_server):
+    url, requests = http_server()
+    file = File(url, multipart_threshold=1024, multipart_chunksize=4096)
+    with open(file.path, "rb") as f:
+        assert f.read() == HTTP_DATA
+    assert sorted(r for m, r in requests if m == "GET") == [
+        "bytes=0-4095",
+        "bytes=4096-8191",
+        "bytes=8192-10239",
+    ]
+
+
+def test_download_http_file_range_ignored(http_server):
+    url, requests = http_server(ranged_get=False)
+    file = File(url, multipart_threshold=1024, multipart_chunksize=4096)
+    with open(file.path, "rb") as f:
+        assert f.read() == HTTP_DATA
+    assert requests[-1] == ("GET", None)
+
+
+def test_download_http_file_head_not_allowed(http_server):
+    url, requests = http_server(head=False)
+    file = File(url, multipart_threshold=1024)
+    with open(file.path, "rb") as f:
+        assert f.read() == HTTP_DATA
+    assert requests == [("HEAD", None), ("GET", None)]
+
+
+@pytest.mark.parametrize("retry_mode", ["standard", "legacy", "adaptive"])
+def test_download_s3_file_random_state(monkeypatch, http_server, retry_mode):
+    url, requests = http_server(errors=2)
+    monkeypatch.setenv("AWS_ENDPOINT_URL_S3", url.rsplit("/", 1)[0])
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_CONFIG_FILE", "/nonexistent")
+    monkeypatch.setenv("AWS_SHARED_CREDENTIALS_FILE", "/nonexistent")
+    monkeypatch.setattr(file_module, "_s3_resources", OrderedDict())
+    # botocore sleeps for the backoff in its endpoint.
+    monkeypatch.setattr("botocore.endpoint.time.sleep", lambda _: None)
+
+    random.seed(0)
+    state = random.getstate()
+    file = File("s3://bkt/data.bin", region_name="us-east-1", retry_mode=retry_mode)
+    with open(file.path, "rb") as f:
+        assert f.read() == HTTP_DATA
+    assert requests[:3] == [("HEAD", None)] * 3
+    assert random.getstate() == state
+
+
+def test_s3_resource_cache(monkeypatch):
+    built = []
+
+    def new_s3_resource(*args):
+        time.sleep(0.05)
+        built.append(args)
+        return object()
+
+    monkeypatch.setattr(file_module, "_new_s3_resource", new_s3_resource)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        resources = list(
+            executor.map(lambda _: file_module._s3_resource("cache-a"), range(8))
+        )
+    assert built == [("cache-a",)]
+    assert all(resource is resources[0] for resource in resources)
+
+    other = file_module._s3_resource("cache-b")
+    file_module._forget_s3_resource("cache-a")
+    assert file_module._s3_resource("cache-b") is other
+    assert file_module._s3_resource("cache-a") is not resources[0]
+    assert built == [("cache-a",), ("cache-b",), ("cache-a",)]
+    file_module._forget_s3_resource("cache-a")
+    file_module._forget_s3_resource("cache-b")
+
+
+@pytest.fixture
+def downloaded(monkeypatch):
+    downloaded = []
+
+    def download_many(cls, paths, max_workers=16, **kwargs):
+        downloaded.append((paths, kwargs))
+        return []
+
+    monkeypatch.setattr(File, "download_many", classmethod(download_many))
+    return downloaded
+
+
+def test_from_prefix(monkeypatch, downloaded):
+    pages = [
+        {"Contents": [{"Key": "p/b.txt"}, {"Key": "p/dir/"}, {"Key": "p/a.txt"}]},
+        {},
+        {"Contents": [{"Key": "p/dir/c.txt"}]},
+    ]
+    client = StubS3Client(pages=pages)
+    use_s3_client(monkeypatch, client)
+    File.from_prefix("s3://bkt/p/", max_workers=4, max_concurrency=3)
+    assert client.calls == [("paginate", "p/")]
+    paths, kwargs = downloaded[0]
+    assert paths == ["s3://bkt/p/b.txt", "s3://bkt/p/a.txt", "s3://bkt/p/dir/c.txt"]
+    assert kwargs["max_pool_connections"] == 12
+
+
+def test_from_prefix_keys_kept(monkeypatch):
+    pages = [{"Contents": [{"Key": "p//a.txt"}, {"Key": "p/b//"}]}]
+    client = StubS3Client(b"data", pages=pages)
+    use_s3_client(monkeypatch, client)
+    files = File.from_prefix("s3://bkt/p")
+    assert [file.orig_path for file in files] == ["s3://bkt/p//a.txt"]
+    assert ("head_object", "p//a.txt") in client.calls
+    with open(files[0].path, "rb") as f:
+        assert f.read() == b"data"
+
+
+def test_from_prefix_not_retried(monkeypatch, caplog, downloaded):
+    errors = {"paginate": [client_error("AccessDenied", "ListObjectsV2")]}
+    use_s3_client(monkeypatch, StubS3Client(errors=errors))
+    with pytest.raises(ClientError):
+        File.from_prefix("s3://bkt/p")
+    assert "Failed to list the objects: s3://bkt/p." in caplog.text
+    assert downloaded == []
+
+
+def test_from_prefix_retried(monkeypatch, sleeps, downloaded):
+    client = StubS3Client(
+        pages=[{"Contents": [{"Key": "p"}]}],
+        errors={"paginate": [credential_error()]},
+    )
+    use_s3_client(monkeypatch, client)
+    File.from_prefix("s3://bkt/p", max_trials=2)
+    assert client.calls == [("paginate", "p")] * 2
+    assert downloaded[0][0] == ["s3://bkt/p"]
+
+
+def test_from_prefix_not_s3():
+    with pytest.raises(ValueError, match="should start with s3"):
+        File.from_prefix("/tmp/dir")